@@ -11,4 +11,6 @@ from .version import __version__
 from .core import (
     AR_categorization_scheme,
     AR_categorization_evolution_scheme,
+    ARResult,
 )
+from .xarray_wrapper import apply_ar_scheme
@@ -0,0 +1,192 @@
+"""
+Numba-compiled kernels for AR categorization.
+
+Numba is imported lazily: when it is not installed, `HAS_NUMBA` is False
+and the kernels below run as plain Python functions.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+prange = numba.prange if HAS_NUMBA else range
+
+
+def _njit(func=None, **options):
+    """
+    Compile `func` with Numba if available, otherwise return it unchanged.
+
+    Extra keyword arguments (e.g. ``parallel=True``) are passed to
+    `numba.njit`.
+    """
+    if func is None:
+        return lambda f: _njit(f, **options)
+    if not HAS_NUMBA:
+        return func
+    return numba.njit(cache=True, boundscheck=False, **options)(func)
+
+
+@_njit
+def duration_delta(duration, steps_per_day):
+    """
+    Category adjustment for an event of `duration` timesteps, without
+    branches: -1 if shorter than 1 day, +1 if 2 days or longer, else 0.
+    """
+    return int(duration >= 2 * steps_per_day) - int(duration < steps_per_day)
+
+
+@_njit
+def kahan_add(total, compensation, value):
+    """
+    Add `value` to `total` with Kahan compensated summation.
+
+    Returns the new total and compensation term. Once the total is no
+    longer finite there is nothing left to compensate (inf - inf would
+    turn it into NaN), so the compensation is reset to 0.
+    """
+    y = value - compensation
+    t = total + y
+    if not np.isfinite(t):
+        return t, 0.0
+    return t, (t - total) - y
+
+
+@_njit
+def bin_value(ivt, bin_width, max_category):
+    """
+    Scalar version of `utils.bin_ivt`. NaN IVT maps to 0 (the comparisons
+    below are False for NaN), +inf to `max_category` and -inf to 0.
+    """
+    b = ivt / bin_width
+    if b >= max_category:
+        return max_category
+    if b > 0:
+        return int(b)
+    return 0
+
+
+def _make_kernels(collapse, fixed_steps_per_day=0):
+    """
+    Build the row and grid (threaded and serial) categorization kernels
+    for one scheme.
+
+    `collapse` is captured as a compile-time constant, so each scheme gets
+    its own specialization with the unused branch compiled out. A nonzero
+    `fixed_steps_per_day` is baked in the same way (the `steps_per_day`
+    argument is then ignored), letting the duration thresholds fold to
+    literals; 0 builds a generic kernel that reads it at run time.
+    """
+
+    @_njit
+    def categorize_row(ivt, steps_per_day, bin_width, max_category,
+                       final, cumulative, ivt_event, duration):
+        """
+        Run the full AR categorization on one IVT time series.
+
+        Bins IVT, optionally collapses each event to its peak, applies the
+        duration rule and accumulates IVT, writing into the output arrays.
+        """
+        if fixed_steps_per_day:
+            steps_per_day = fixed_steps_per_day
+
+        n = len(ivt)
+        start = -1
+        peak = 0
+
+        for i in range(n + 1):
+            if i < n:
+                cat = bin_value(ivt[i], bin_width, max_category)
+                final[i] = cat
+                if cat != 0:
+                    if start < 0:
+                        start = i
+                        peak = cat
+                    elif cat > peak:
+                        peak = cat
+                    continue
+
+                cumulative[i] = 0
+                ivt_event[i] = 0
+                duration[i] = 0
+
+            if start < 0:
+                continue
+
+            # Event [start, i) has ended: adjust categories and accumulate IVT
+            dur = i - start
+            delta = duration_delta(dur, steps_per_day)
+
+            running = 0.0
+            compensation = 0.0
+            for j in range(start, i):
+                cat = peak if collapse else final[j]
+                cat = min(max(cat + delta, 0), max_category)
+                final[j] = cat
+                duration[j] = dur
+                if cat > 0:
+                    running, compensation = kahan_add(running, compensation, ivt[j])
+                    ivt_event[j] = ivt[j]
+                else:
+                    running = 0.0
+                    compensation = 0.0
+                    ivt_event[j] = 0
+                cumulative[j] = running
+
+            start = -1
+
+    @_njit(parallel=True)
+    def ar_scheme_2d(ivt_2d, steps_per_day, bin_width, max_category,
+                     final, cumulative, ivt_event, duration):
+        """
+        Apply `categorize_row` to every row of a (gridpoint, time) array,
+        spreading rows across threads.
+        """
+        for k in prange(ivt_2d.shape[0]):
+            categorize_row(
+                ivt_2d[k], steps_per_day, bin_width, max_category,
+                final[k], cumulative[k], ivt_event[k], duration[k],
+            )
+
+    @_njit
+    def ar_scheme_2d_serial(ivt_2d, steps_per_day, bin_width, max_category,
+                            final, cumulative, ivt_event, duration):
+        """
+        Single-threaded `ar_scheme_2d`, for callers that are already
+        running in a worker thread (e.g. a Dask task).
+        """
+        for k in range(ivt_2d.shape[0]):
+            categorize_row(
+                ivt_2d[k], steps_per_day, bin_width, max_category,
+                final[k], cumulative[k], ivt_event[k], duration[k],
+            )
+
+    return categorize_row, ar_scheme_2d, ar_scheme_2d_serial
+
+
+# Steps per day of common reanalysis output (6-hourly, 3-hourly, hourly)
+# that get their own kernel specializations
+SPECIALIZED_STEPS_PER_DAY = (4, 8, 24)
+
+# (row, threaded grid, serial grid) kernels keyed by (collapse, steps_per_day): collapse is
+# True for the event-based scheme and False for the evolution-based one;
+# steps_per_day is 0 for the generic kernels.
+KERNELS = {
+    (collapse, steps_per_day): _make_kernels(collapse, steps_per_day)
+    for collapse in (True, False)
+    for steps_per_day in (0,) + SPECIALIZED_STEPS_PER_DAY
+}
+
+
+def get_kernels(collapse, steps_per_day):
+    """
+    Return the (row, threaded grid, serial grid) kernels for a scheme,
+    specialized for `steps_per_day` when available and generic otherwise.
+    """
+    if steps_per_day in SPECIALIZED_STEPS_PER_DAY:
+        return KERNELS[collapse, steps_per_day]
+    return KERNELS[collapse, 0]
@@ -7,47 +7,42 @@ This module contains:
 - IVT-only and duration-only outputs for detailed analysis
 """
 
+import threading  # Detects calls from worker threads (e.g. Dask tasks)
+from typing import NamedTuple  # Container for scheme outputs
+
 import numpy as np  # Import NumPy for array operations
+from . import _numba  # Compiled kernels (optional Numba acceleration)
 from .utils import (  # Import helper functions from utils
     compute_steps_per_day,  # Converts time resolution (hours) to timesteps per day
+    category_dtype,         # Narrow integer dtype used for category arrays
+    float_dtype,            # Float dtype of IVT and its outputs (keeps float32)
     bin_ivt,                # Converts IVT values into AR categories
-    cumulative_reset,       # Computes cumulative IVT resetting at zeros
-    max_bounded_replace     # Collapses nonzero segments to their maximum value
+    masked_cumsum,          # Computes cumulative IVT resetting at zeros
+    max_bounded_replace,    # Collapses nonzero segments to their maximum value
+    _nonzero_runs           # Finds start/end indices of nonzero segments
 )
 
 # ------------------------
-# Internal helper functions
+# Scheme outputs
 # ------------------------
 
-def _adjust_segment(arr, start, end, duration, steps_per_day):
+class ARResult(NamedTuple):
     """
-    Apply duration adjustment rule to a segment (in-place modification).
+    Outputs of an AR categorization scheme.
 
-    Parameters
-    ----------
-    arr : np.ndarray
-        Array of AR categories to modify.
-    start : int
-        Start index of the event segment.
-    end : int
-        End index of the event segment.
-    duration : int
-        Duration of the segment in timesteps.
-    steps_per_day : int
-        Number of timesteps that correspond to 1 day.
+    A tuple ``(final_categories, cumulative_ivt, ivt_event, duration_event)``
+    whose items are also available by name.
     """
 
-    # If duration is shorter than 1 day, downgrade the category by 1
-    if duration < steps_per_day:
-        arr[start:end] -= 1  # Subtract 1 from all elements in the segment
-
-    # If duration is longer than or equal to 2 days, upgrade the category by 1
-    elif duration >= 2 * steps_per_day:
-        arr[start:end] += 1  # Add 1 to all elements in the segment
-
-    # Otherwise (duration 1–2 days), do nothing (leave category unchanged)
+    final_categories: np.ndarray  # Categorized AR values
+    cumulative_ivt: np.ndarray  # Cumulative IVT over AR events
+    ivt_event: np.ndarray  # IVT values only during AR events, zero elsewhere
+    duration_event: np.ndarray  # Duration in timesteps for each AR event
 
 # ------------------------
+# Internal helper functions
+# ------------------------
+
 def _apply_duration_rule(categories, steps_per_day, max_category):
     """
     Apply the duration adjustment to continuous AR events.
@@ -69,65 +64,133 @@ def _apply_duration_rule(categories, steps_per_day, max_category):
         Array of duration (in timesteps) for each AR event at each index.
     """
 
-    final = categories.copy()  # Copy categories to avoid modifying input
-    n = len(categories)  # Total number of timesteps
-    start = None  # Initialize start index of current event
-    duration_arr = np.zeros_like(categories, dtype=float)  # Store duration per timestep
-
-    # Loop over each timestep to find AR events
-    for i in range(n):
-        if categories[i] == 0:  # Found a zero → end of AR event
-            if start is not None:  # There was an ongoing event
-                end = i  # End index of the event
-                duration = end - start  # Compute duration in timesteps
-                _adjust_segment(final, start, end, duration, steps_per_day)  # Apply duration rule
-                duration_arr[start:end] = duration  # Store duration for all timesteps in event
-                start = None  # Reset start for next event
-        else:
-            if start is None:  # Found start of a new AR event
-                start = i  # Mark start index
-
-    # Handle event that goes until the last timestep
-    if start is not None:
-        end = n  # End index is last timestep
-        duration = end - start  # Duration of the event
-        _adjust_segment(final, start, end, duration, steps_per_day)  # Apply duration rule
-        duration_arr[start:end] = duration  # Store duration
-
-    # Ensure all categories are within allowed bounds
-    return np.clip(final, 0, max_category), duration_arr  # Return adjusted categories and duration array
+    # Vectorized run-length pass: each event gets a category delta from its
+    # duration, spread over the event with a single cumsum of +delta/-delta
+    # steps placed at event starts/ends. (With Numba the schemes use the
+    # fused kernel instead, which applies the rule inline.)
+    starts, ends = _nonzero_runs(categories != 0)  # Event boundaries
+    durations = ends - starts  # Duration of each event in timesteps
+
+    # Per-event category adjustment from the duration rule
+    # (branchless: +1 for >= 2 days, -1 for < 1 day, 0 otherwise)
+    delta = (
+        (durations >= 2 * steps_per_day).astype(categories.dtype)
+        - (durations < steps_per_day).astype(categories.dtype)
+    )
+
+    # Events are separated by zeros, so starts and ends never collide and
+    # plain fancy assignment is enough (no need for np.add.at). The running
+    # sum only takes -1, 0 or 1, so it stays in the category dtype.
+    steps = np.zeros(len(categories) + 1, dtype=categories.dtype)
+    steps[starts] = delta
+    steps[ends] = -delta
+
+    # Apply the deltas and keep categories within allowed bounds, reusing
+    # the cumsum buffer so neither step allocates another array
+    final = np.cumsum(steps[:-1], dtype=categories.dtype)
+    final += categories
+    np.clip(final, 0, max_category, out=final)
+
+    # Duration of the enclosing event at each timestep, 0 elsewhere: lay
+    # out alternating (gap, event) segments and expand them in one repeat
+    n_segments = 2 * len(starts) + 1
+    segment_lengths = np.empty(n_segments, dtype=np.int64)
+    segment_lengths[0:-1:2] = starts - np.concatenate(([0], ends[:-1]))
+    segment_lengths[1::2] = durations
+    segment_lengths[-1] = len(categories) - (ends[-1] if len(ends) else 0)
+
+    segment_values = np.zeros(n_segments, dtype=float)
+    segment_values[1::2] = durations
+
+    duration_arr = np.repeat(segment_values, segment_lengths)
+
+    return final, duration_arr
 
 # ------------------------
-# Event-based AR categorization
-# ------------------------
+def _fused_scheme(ivt_array, steps_per_day, bin_width, max_category, collapse):
+    """
+    Run a full categorization scheme with the fused Numba kernel.
 
-def AR_categorization_scheme(
-    ivt_array: np.ndarray,  # Input IVT values
-    time_resolution_hours: int = 6,  # Time resolution of data in hours
-    bin_width: float = 250.0,  # Width of each IVT bin for categorization
-    max_category: int = 6  # Maximum AR category
-):
+    Binning, optional collapse to peak, the duration rule and the
+    cumulative IVT are all done in one sweep over each IVT time series.
+    Arrays with more than one dimension (time last) are processed as a
+    batch of rows, spread across threads when called from the main thread.
     """
-    Event-based AR categorization (collapses each event to peak intensity).
 
-    Returns:
-        final_categories : np.ndarray -> categorized AR values
-        cumulative_ivt : np.ndarray -> cumulative IVT over AR events
-        ivt_event : np.ndarray -> IVT values only during AR events
-        duration_event : np.ndarray -> duration in timesteps for each AR event
+    ivt = np.ascontiguousarray(ivt_array)  # Kernel reads IVT sequentially
+
+    # Output arrays, filled in place by the kernel
+    final_categories = np.empty(ivt.shape, dtype=category_dtype(max_category))
+    cumulative_ivt = np.empty_like(ivt)
+    ivt_event = np.empty_like(ivt)
+    duration_event = np.empty(ivt.shape, dtype=float)
+
+    # Kernels specialized for this scheme (and time resolution, if common)
+    categorize_row, ar_scheme_2d, ar_scheme_2d_serial = _numba.get_kernels(
+        collapse, steps_per_day
+    )
+
+    if ivt.ndim == 1:
+        categorize_row(
+            ivt, steps_per_day, bin_width, max_category,
+            final_categories, cumulative_ivt, ivt_event, duration_event,
+        )
+    else:
+        # Flatten leading dimensions to (gridpoint, time); reshape gives
+        # views, so the kernel writes straight into the outputs. The row
+        # count is explicit because -1 cannot be inferred when n_time is 0.
+        n_time = ivt.shape[-1]
+        n_rows = int(np.prod(ivt.shape[:-1]))
+
+        # Worker threads (e.g. Dask tasks) are already parallel over
+        # chunks; starting Numba's thread pool from them oversubscribes the
+        # CPUs and, with the TBB threading layer, hangs at interpreter exit
+        grid_kernel = (
+            ar_scheme_2d
+            if threading.current_thread() is threading.main_thread()
+            else ar_scheme_2d_serial
+        )
+        grid_kernel(
+            ivt.reshape(n_rows, n_time), steps_per_day, bin_width, max_category,
+            final_categories.reshape(n_rows, n_time),
+            cumulative_ivt.reshape(n_rows, n_time),
+            ivt_event.reshape(n_rows, n_time),
+            duration_event.reshape(n_rows, n_time),
+        )
+
+    return ARResult(final_categories, cumulative_ivt, ivt_event, duration_event)
+
+# ------------------------
+def _numpy_scheme(ivt_array, steps_per_day, bin_width, max_category, collapse):
     """
+    Run a full categorization scheme with the vectorized NumPy helpers.
 
-    # Compute how many timesteps correspond to 1 day
-    steps_per_day = compute_steps_per_day(time_resolution_hours)
+    Arrays with more than one dimension (time last) are laid out end to
+    end as one long series, with a zero-IVT timestep after every row so
+    that no event spans two rows.
+    """
 
-    # Copy IVT array to preserve original
-    original_ivt = ivt_array.copy()
+    if np.ndim(ivt_array) > 1:
+        n_time = ivt_array.shape[-1]
+        padded = np.zeros(ivt_array.shape[:-1] + (n_time + 1,), dtype=ivt_array.dtype)
+        padded[..., :n_time] = ivt_array
+
+        result = _numpy_scheme(
+            padded.ravel(), steps_per_day, bin_width, max_category, collapse
+        )
+        return ARResult(
+            *(out.reshape(padded.shape)[..., :n_time] for out in result)
+        )
+
+    # Keep a reference to the raw IVT; nothing below modifies it in place
+    original_ivt = ivt_array
 
     # Bin IVT values into categories
     categories = bin_ivt(ivt_array, bin_width, max_category)
 
-    # Collapse each nonzero event segment to its maximum value
-    categories = max_bounded_replace(categories)
+    # Collapse each nonzero event segment to its maximum value (event-based only)
+    if collapse:
+        categories = max_bounded_replace(categories)
 
     # Apply duration rule to event segments and get duration per timestep
     final_categories, duration_event = _apply_duration_rule(categories, steps_per_day, max_category)
@@ -135,56 +198,93 @@ def AR_categorization_scheme(
     # Create mask of where AR events occur (category > 0)
     mask = final_categories > 0
 
-    # Compute cumulative IVT over AR events
-    cumulative_ivt = cumulative_reset(original_ivt, mask)
-
-    # Extract IVT values only during AR events, zero elsewhere
+    # Keep IVT only during AR events (np.where rather than multiplying by
+    # the mask: NaN * 0 is NaN)
     ivt_event = np.where(mask, original_ivt, 0)
 
-    # Return final categories, cumulative IVT, IVT-only, duration-only arrays
-    return final_categories, cumulative_ivt, ivt_event, duration_event
+    # Compute cumulative IVT over AR events from the masked IVT
+    cumulative_ivt = masked_cumsum(ivt_event, mask)
+
+    # Return final categorized array, cumulative IVT, IVT-only values, and duration
+    return ARResult(final_categories, cumulative_ivt, ivt_event, duration_event)
 
 # ------------------------
-# Evolution-based AR categorization
+def _ar_scheme(ivt_array, time_resolution_hours, bin_width, max_category, collapse):
+    """
+    Shared implementation of the event- and evolution-based schemes.
+
+    `collapse` selects whether each event is collapsed to its peak
+    intensity (event-based) or keeps its evolution (evolution-based).
+    """
+
+    # Work in the float dtype of the outputs: native byte order (Numba
+    # cannot compile big-endian arrays) and float32 for float16 (which it
+    # does not support); float32/float64 input is not copied
+    ivt_array = np.asarray(ivt_array)
+    ivt_array = ivt_array.astype(float_dtype(ivt_array.dtype), copy=False)
+
+    # Compute how many timesteps correspond to 1 day
+    steps_per_day = compute_steps_per_day(time_resolution_hours)
+
+    # Single fused pass when Numba is available
+    if _numba.HAS_NUMBA:
+        return _fused_scheme(ivt_array, steps_per_day, bin_width, max_category, collapse)
+
+    # Otherwise chain the vectorized NumPy helpers
+    return _numpy_scheme(ivt_array, steps_per_day, bin_width, max_category, collapse)
+
+# ------------------------
+# Event-based AR categorization
 # ------------------------
 
-def AR_categorization_evolution_scheme(
+def AR_categorization_scheme(
     ivt_array: np.ndarray,  # Input IVT values
     time_resolution_hours: int = 6,  # Time resolution of data in hours
-    bin_width: float = 250.0,  # IVT bin width
+    bin_width: float = 250.0,  # Width of each IVT bin for categorization
     max_category: int = 6  # Maximum AR category
 ):
     """
-    Evolution-based AR categorization (keeps intensity evolution inside each event).
+    Event-based AR categorization (collapses each event to peak intensity).
+
+    `ivt_array` may have any number of leading dimensions (e.g. gridpoints);
+    time must be the last axis.
 
     Returns:
+        ARResult, a tuple of:
         final_categories : np.ndarray -> categorized AR values
         cumulative_ivt : np.ndarray -> cumulative IVT over AR events
         ivt_event : np.ndarray -> IVT values only during AR events
         duration_event : np.ndarray -> duration in timesteps for each AR event
     """
 
-    # Compute timesteps per day
-    steps_per_day = compute_steps_per_day(time_resolution_hours)
-
-    # Copy IVT array to preserve original
-    original_ivt = ivt_array.copy()
+    return _ar_scheme(
+        ivt_array, time_resolution_hours, bin_width, max_category, collapse=True
+    )
 
-    # Bin IVT values into categories
-    categories = bin_ivt(ivt_array, bin_width, max_category)
-
-    # No collapsing for evolution scheme
-    # Apply duration rule to event segments and get duration per timestep
-    final_categories, duration_event = _apply_duration_rule(categories, steps_per_day, max_category)
+# ------------------------
+# Evolution-based AR categorization
+# ------------------------
 
-    # Mask of AR events
-    mask = final_categories > 0
+def AR_categorization_evolution_scheme(
+    ivt_array: np.ndarray,  # Input IVT values
+    time_resolution_hours: int = 6,  # Time resolution of data in hours
+    bin_width: float = 250.0,  # IVT bin width
+    max_category: int = 6  # Maximum AR category
+):
+    """
+    Evolution-based AR categorization (keeps intensity evolution inside each event).
 
-    # Compute cumulative IVT over AR events
-    cumulative_ivt = cumulative_reset(original_ivt, mask)
+    `ivt_array` may have any number of leading dimensions (e.g. gridpoints);
+    time must be the last axis.
 
-    # Extract IVT values only during AR events, zero elsewhere
-    ivt_event = np.where(mask, original_ivt, 0)
+    Returns:
+        ARResult, a tuple of:
+        final_categories : np.ndarray -> categorized AR values
+        cumulative_ivt : np.ndarray -> cumulative IVT over AR events
+        ivt_event : np.ndarray -> IVT values only during AR events
+        duration_event : np.ndarray -> duration in timesteps for each AR event
+    """
 
-    # Return final categories, cumulative IVT, IVT-only, duration-only arrays
-    return final_categories, cumulative_ivt, ivt_event, duration_event
+    return _ar_scheme(
+        ivt_array, time_resolution_hours, bin_width, max_category, collapse=False
+    )
@@ -22,6 +22,56 @@ def compute_steps_per_day(time_resolution_hours: int) -> int:
     return int(24 / time_resolution_hours)
 
 
+def category_dtype(max_category: int) -> np.dtype:
+    """
+    Smallest signed integer dtype able to hold AR categories.
+
+    Leaves room for the +/-1 duration adjustment applied before clipping
+    (values from -1 to `max_category + 1`), so `np.int8` for any
+    realistic `max_category`.
+
+    Parameters
+    ----------
+    max_category : int
+        Maximum AR category.
+
+    Returns
+    -------
+    np.dtype
+        Integer dtype for category arrays.
+    """
+    # A signed type that holds -(n + 1) also holds +n, so ask for
+    # -(max_category + 2) to fit max_category + 1
+    return np.min_scalar_type(-(max_category + 2))
+
+
+def float_dtype(dtype) -> np.dtype:
+    """
+    Floating-point dtype used for IVT-derived outputs.
+
+    float32 (e.g. reanalysis IVT) and float64 inputs keep their dtype,
+    float16 is promoted to float32 and anything else to float64. The
+    result is always in native byte order, so big-endian input (e.g. from
+    netCDF3 files) can be passed to the compiled kernels.
+
+    Parameters
+    ----------
+    dtype : dtype-like
+        Dtype of the input IVT.
+
+    Returns
+    -------
+    np.dtype
+        Dtype for cumulative IVT arrays.
+    """
+    dtype = np.dtype(dtype).newbyteorder("=")
+    if dtype in (np.float32, np.float64):
+        return dtype
+    if dtype == np.float16:
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
 def bin_ivt(ivt_array: np.ndarray, bin_width: float, max_category: int):
     """
     Convert IVT values to AR categories.
@@ -32,29 +82,95 @@ def bin_ivt(ivt_array: np.ndarray, bin_width: float, max_category: int):
         0–249   -> 0
         250–499 -> 1
         etc.
+
+    Missing (NaN) IVT maps to category 0.
+
+    A single float buffer is reused for every step. Truncation in the
+    final integer cast equals floor once values are clipped to >= 0, so
+    no separate floor pass is needed.
     """
-    bins = np.floor(ivt_array / bin_width)
-    bins = np.clip(bins, 0, max_category)
-    return bins.astype(int)
+    # Divide in float64 like the compiled kernel, so float32 IVT next to a
+    # bin edge lands in the same bin on both paths. NaN has no defined
+    # integer cast; +/-inf are clipped below.
+    bins = np.asarray(np.divide(ivt_array, bin_width, dtype=np.float64))
+    np.nan_to_num(bins, copy=False, nan=0.0)
+    np.clip(bins, 0, max_category, out=bins)
+    return bins.astype(category_dtype(max_category))
 
 
-def cumulative_reset(values: np.ndarray, mask: np.ndarray):
+def cumulative_reset(values: np.ndarray, mask: np.ndarray, method: str = "segmented"):
     """
     Compute cumulative sum that resets when mask == 0.
 
-    Used to compute cumulative IVT per AR event.
+    Used to compute cumulative IVT per AR event. See `masked_cumsum` for
+    `method`.
     """
-    result = np.zeros_like(values, dtype=float)
-    running_sum = 0.0
+    return masked_cumsum(np.where(mask != 0, values, 0), mask, method)
 
-    for i in range(len(values)):
-        if mask[i] == 0:
-            running_sum = 0.0
-        else:
-            running_sum += values[i]
-        result[i] = running_sum
 
-    return result
+def masked_cumsum(masked_values: np.ndarray, mask: np.ndarray, method: str = "segmented"):
+    """
+    Cumulative sum that resets when mask == 0, for values that are
+    already zero wherever mask == 0.
+
+    Two pure NumPy methods are available:
+
+    - ``"segmented"`` (default): a single global cumsum minus the cumsum
+      value at the most recent reset. Fastest, but the subtraction loses
+      precision once the whole-series total is much larger than a
+      single event. Non-finite values are kept out of the global cumsum,
+      so a NaN or inf only affects the event it occurs in.
+    - ``"split"``: split the values at every reset and run `np.cumsum`
+      on each piece. Each event is summed independently, which costs one
+      NumPy call per event.
+
+    The result keeps the dtype of floating-point inputs (see
+    `float_dtype`); sums are always accumulated in float64.
+    """
+    dtype = float_dtype(masked_values.dtype)
+
+    if method == "split":
+        # Every piece after the first starts at a reset, whose value is 0
+        pieces = np.split(masked_values, np.flatnonzero(mask == 0))
+        result = np.concatenate(
+            [np.cumsum(piece, dtype=np.float64) for piece in pieces]
+        )
+        return result.astype(dtype, copy=False)
+
+    if method != "segmented":
+        raise ValueError(
+            f"Unknown method {method!r}; expected 'segmented' or 'split'"
+        )
+
+    # Index (into cumsum shifted by one) of the last reset at or before
+    # each timestep; 0 points at the leading zero before any reset.
+    last_reset = _last_index(mask == 0)
+
+    # NaN/inf would spread through the global cumsum into every later
+    # event, so they are summed separately below
+    finite = np.isfinite(masked_values)
+    has_nonfinite = not finite.all()
+
+    # float64 even for float32 input: the segmented cumsum subtracts
+    # values of the size of the whole-series total
+    cumsum = np.cumsum(
+        np.where(finite, masked_values, 0) if has_nonfinite else masked_values,
+        dtype=np.float64,
+    )
+    offset = np.concatenate(([0.0], cumsum))[last_reset]
+    result = cumsum - offset
+
+    if has_nonfinite:
+        # Within an event, the running sum is NaN after a NaN or after both
+        # +inf and -inf, and +/-inf after only one kind of inf
+        seen_nan = _last_index(np.isnan(masked_values)) > last_reset
+        seen_pos = _last_index(masked_values == np.inf) > last_reset
+        seen_neg = _last_index(masked_values == -np.inf) > last_reset
+        result[seen_pos] = np.inf
+        result[seen_neg] = -np.inf
+        result[seen_nan | (seen_pos & seen_neg)] = np.nan
+
+    return result.astype(dtype, copy=False)
 
 
 def max_bounded_replace(arr: np.ndarray):
@@ -67,20 +183,41 @@ def max_bounded_replace(arr: np.ndarray):
     Used in event-based scheme to collapse AR event
     to peak intensity.
     """
-    arr = arr.copy()
-    n = len(arr)
-    start = None
+    nonzero = arr != 0
+    starts, ends = _nonzero_runs(nonzero)
+
+    result = np.zeros_like(arr)
+    if len(starts) == 0:
+        return result
 
-    for i in range(n):
-        if arr[i] == 0:
-            if start is not None:
-                arr[start:i] = np.max(arr[start:i])
-                start = None
-        else:
-            if start is None:
-                start = i
+    # Reduce over [start, end) pairs; every second segment is a zero gap.
+    bounds = np.column_stack((starts, ends)).ravel()
+    if bounds[-1] == len(arr):
+        bounds = bounds[:-1]
+    peaks = np.maximum.reduceat(arr, bounds)[::2]
+
+    result[nonzero] = np.repeat(peaks, ends - starts)
+    return result
 
-    if start is not None:
-        arr[start:n] = np.max(arr[start:n])
 
-    return arr
+def _last_index(flags: np.ndarray):
+    """
+    For each position, one plus the index of the last True in `flags` at
+    or before it (0 if there is none yet).
+    """
+    last = np.where(flags, np.arange(1, len(flags) + 1), 0)
+    np.maximum.accumulate(last, out=last)
+    return last
+
+
+def _nonzero_runs(nonzero: np.ndarray):
+    """
+    Locate runs of consecutive True values in a boolean array.
+
+    Returns
+    -------
+    starts, ends : np.ndarray
+        Start (inclusive) and end (exclusive) index of each run.
+    """
+    edges = np.diff(np.concatenate(([0], nonzero.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
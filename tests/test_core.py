@@ -1,5 +1,35 @@
+import math
+import os
+import subprocess
+import sys
+from pathlib import Path
+
 import numpy as np
-from arcat.core import AR_categorization_scheme, AR_categorization_evolution_scheme
+import pytest
+import xarray as xr
+from arcat import _numba, apply_ar_scheme
+from arcat.core import (
+    AR_categorization_scheme,
+    AR_categorization_evolution_scheme,
+    _apply_duration_rule,
+)
+from arcat.utils import (
+    bin_ivt,
+    category_dtype,
+    cumulative_reset,
+    float_dtype,
+    masked_cumsum,
+    max_bounded_replace,
+)
+
+
+@pytest.fixture(params=["numba", "numpy"])
+def backend(request, monkeypatch):
+    """Run a test with the fused Numba kernels and with the NumPy helpers."""
+    if request.param == "numba" and not _numba.HAS_NUMBA:
+        pytest.skip("numba not installed")
+    monkeypatch.setattr(_numba, "HAS_NUMBA", request.param == "numba")
+    return request.param
 
 
 def test_short_event_downgrade():
@@ -25,4 +55,275 @@ def test_long_event_upgrade():
         max_category=6             # Maximum AR category
     )
 
-    assert np.all(final_cat >= 3)
\ No newline at end of file
+    assert np.all(final_cat >= 3)
+
+@pytest.mark.parametrize("method", ["segmented", "split"])
+def test_cumulative_reset(method):
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    mask = np.array([1, 1, 0, 1, 1, 1])
+
+    result = cumulative_reset(values, mask, method)
+
+    assert np.allclose(result, [1, 3, 0, 4, 9, 15])
+
+    # Masked-out NaN is dropped, not propagated
+    result = cumulative_reset(np.array([np.nan, 1.0, 2.0]), np.array([0, 1, 1]), method)
+    assert np.array_equal(result, [0, 1, 3])
+
+
+def test_max_bounded_replace():
+    arr = np.array([1, 2, 3, 0, 2, 1])
+
+    assert np.array_equal(max_bounded_replace(arr), [3, 3, 3, 0, 2, 2])
+    assert np.array_equal(max_bounded_replace(np.zeros(4, dtype=int)), [0, 0, 0, 0])
+
+
+def test_duration_rule():
+    categories = np.array([1, 1, 0, 2, 2, 2, 2, 2, 2, 2, 2, 0, 3, 3, 3, 3, 6])
+
+    final, duration = _apply_duration_rule(categories, 4, 6)
+
+    assert np.array_equal(final, [0, 0, 0, 3, 3, 3, 3, 3, 3, 3, 3, 0, 3, 3, 3, 3, 6])
+    assert np.array_equal(duration, [2, 2, 0] + [8] * 8 + [0] + [5] * 5)
+
+
+def test_apply_ar_scheme_matches_1d():
+    ivt = np.array([[300, 300, 0, 800, 800, 800, 800, 800, 800, 800, 800, 0],
+                    [0, 600, 1200, 600, 600, 0, 0, 250, 0, 0, 0, 0]])
+    da = xr.DataArray(ivt, dims=("cell", "time"))
+
+    for scheme, func in [("event", AR_categorization_scheme),
+                         ("evolution", AR_categorization_evolution_scheme)]:
+        outputs = apply_ar_scheme(da, scheme=scheme)
+        for row in range(ivt.shape[0]):
+            expected = func(ivt[row])
+            for result, exp in zip(outputs, expected):
+                assert np.allclose(result.values[row], exp)
+
+
+def test_apply_ar_scheme_chunked_matches_1d():
+    rng = np.random.default_rng(1)
+    ivt = rng.random((40, 4, 6)) * 1500
+    da = xr.DataArray(ivt, dims=("time", "lat", "lon"))
+
+    for scheme, func in [("event", AR_categorization_scheme),
+                         ("evolution", AR_categorization_evolution_scheme)]:
+        outputs = apply_ar_scheme(
+            da.chunk({"time": -1, "lat": 2, "lon": 3}), scheme=scheme
+        )
+        for result, expected in zip(outputs, func(np.moveaxis(ivt, 0, -1))):
+            assert np.allclose(result.transpose("lat", "lon", "time").values, expected)
+
+
+@pytest.mark.parametrize("dtype", [">f8", "float16", "int64"])
+def test_apply_ar_scheme_output_dtypes(dtype):
+    ivt = np.array([[800] * 12 + [0, 300, 300]] * 2).astype(dtype)
+    da = xr.DataArray(ivt, dims=("cell", "time")).chunk({"cell": 1})
+
+    for result in apply_ar_scheme(da):
+        assert result.values.dtype == result.dtype
+
+
+def test_float_dtype():
+    assert float_dtype(np.float32) == np.float32
+    assert float_dtype(">f4") == np.float32
+    assert float_dtype(">f8") == np.float64
+    assert float_dtype(np.float16) == np.float32
+    assert float_dtype(np.int64) == np.float64
+
+
+def test_apply_ar_scheme_chunked_exits_cleanly():
+    # Running Numba's thread pool from Dask workers used to hang the
+    # interpreter at exit under the TBB threading layer
+    script = (
+        "import numpy as np, xarray as xr\n"
+        "from arcat import apply_ar_scheme\n"
+        "da = xr.DataArray(np.full((40, 4, 4), 800.0), dims=('time', 'lat', 'lon'))\n"
+        "outputs = apply_ar_scheme(da.chunk({'time': -1, 'lat': 2, 'lon': 2}))\n"
+        "print(int(outputs[0].max()))\n"
+    )
+    repo_root = str(Path(__file__).resolve().parents[1])
+    python_path = [repo_root] + os.environ.get("PYTHONPATH", "").split(os.pathsep)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, python_path)))
+
+    completed = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True, text=True, timeout=120, env=env,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == "4"
+
+
+def test_batched_input_matches_rows(backend):
+    rng = np.random.default_rng(0)
+    ivt = rng.random((2, 3, 40)) * 1500 * (rng.random((2, 3, 40)) > 0.3)
+
+    for func in [AR_categorization_scheme, AR_categorization_evolution_scheme]:
+        outputs = func(ivt)
+        for index in np.ndindex(ivt.shape[:-1]):
+            expected = func(ivt[index])
+            for result, exp in zip(outputs, expected):
+                assert result.shape == ivt.shape
+                assert np.allclose(result[index], exp)
+
+
+@pytest.mark.parametrize("shape", [(0,), (3, 0), (0, 5), (2, 0, 4)])
+def test_empty_input(backend, shape):
+    for result in AR_categorization_scheme(np.zeros(shape)):
+        assert result.shape == shape
+
+
+def test_result_is_tuple(backend):
+    ivt = np.array([800.0] * 12 + [np.nan, 100.0])
+
+    result = AR_categorization_scheme(ivt)
+
+    assert isinstance(result, tuple)
+    assert len(result) == 4
+    assert result[0] is result.final_categories
+    assert result[2] is result.ivt_event
+    assert np.array_equal(result.ivt_event, [800.0] * 12 + [0.0, 0.0])
+
+
+def test_scheme_in_vectorized_apply_ufunc():
+    ivt = np.array([[300, 300, 0, 800, 800, 800, 800, 800, 800, 800, 800, 0],
+                    [0, 600, 1200, 600, 600, 0, 0, 250, 0, 0, 0, 0]])
+    da = xr.DataArray(ivt, dims=("cell", "time"))
+
+    outputs = xr.apply_ufunc(
+        AR_categorization_scheme,
+        da,
+        input_core_dims=[["time"]],
+        output_core_dims=[["time"]] * 4,
+        vectorize=True,
+    )
+
+    for row in range(ivt.shape[0]):
+        for result, expected in zip(outputs, AR_categorization_scheme(ivt[row])):
+            assert np.array_equal(result.values[row], expected)
+
+
+def test_float32_preserved(backend):
+    ivt = np.array([800.0] * 12 + [0.0] + [300.0] * 5, dtype=np.float32)
+
+    final_cat, cum_ivt, ivt_event, duration_event = AR_categorization_scheme(ivt)
+
+    assert cum_ivt.dtype == np.float32
+    assert ivt_event.dtype == np.float32
+    assert np.allclose(cum_ivt, AR_categorization_scheme(ivt.astype(float)).cumulative_ivt)
+
+
+@pytest.mark.parametrize("method", ["segmented", "split"])
+def test_masked_cumsum_nonfinite_stays_in_event(method):
+    values = np.array([1.0, np.nan, 1.0, 0.0, 1.0, 2.0, 0.0, np.inf, 1.0])
+    mask = values != 0
+
+    result = masked_cumsum(values, mask, method)
+
+    assert np.allclose(
+        result, [1, np.nan, np.nan, 0, 1, 3, 0, np.inf, np.inf], equal_nan=True
+    )
+
+
+def test_bin_ivt_nonfinite():
+    ivt = np.array([np.nan, np.inf, -np.inf, 300.0])
+
+    with np.errstate(invalid="raise"):
+        bins = bin_ivt(ivt, 250.0, 6)
+
+    assert np.array_equal(bins, [0, 6, 0, 1])
+    assert np.array_equal(bins, [_numba.bin_value(v, 250.0, 6) for v in ivt])
+
+
+def test_category_dtype():
+    assert category_dtype(6) == np.int8
+    assert category_dtype(126) == np.int8
+    assert category_dtype(127) == np.int16
+
+
+def test_top_category_does_not_wrap(backend):
+    # A long event at the top category gains +1 before being clipped
+    ivt = np.full(12, 127 * 250.0)
+    final, _, _, _ = AR_categorization_evolution_scheme(
+        ivt, time_resolution_hours=6, bin_width=250.0, max_category=127
+    )
+
+    assert np.all(final == 127)
+
+
+def test_nan_outside_event_does_not_spread(backend):
+    ivt = np.array([800.0] * 5 + [np.nan] + [800.0] * 5)
+    _, cumulative, _, _ = AR_categorization_scheme(ivt, time_resolution_hours=6)
+
+    expected = np.arange(1, 6) * 800.0
+    assert np.array_equal(cumulative, np.concatenate((expected, [0.0], expected)))
+
+
+@pytest.mark.skipif(not _numba.HAS_NUMBA, reason="numba not installed")
+@pytest.mark.parametrize("time_resolution_hours", [1, 2, 3, 6, 12])
+def test_numba_matches_numpy(monkeypatch, time_resolution_hours):
+    # Sparse gaps give events from a few steps to several days long
+    rng = np.random.default_rng(time_resolution_hours)
+    ivt = (250 + rng.random((4, 300)) * 1500) * (rng.random((4, 300)) > 0.03)
+
+    for func in [AR_categorization_scheme, AR_categorization_evolution_scheme]:
+        monkeypatch.setattr(_numba, "HAS_NUMBA", True)
+        compiled = func(ivt, time_resolution_hours=time_resolution_hours)
+        monkeypatch.setattr(_numba, "HAS_NUMBA", False)
+        vectorized = func(ivt, time_resolution_hours=time_resolution_hours)
+
+        for result, expected in zip(compiled, vectorized):
+            assert np.allclose(result, expected)
+
+
+@pytest.mark.skipif(not _numba.HAS_NUMBA, reason="numba not installed")
+def test_float32_bin_edges_match(monkeypatch):
+    # float32 IVT just below, at and just above edges of a bin width that
+    # float32 cannot represent exactly, laid out as one long event
+    edges = np.float32(333.3) * np.arange(1, 15, dtype=np.float32)
+    ivt = np.concatenate(
+        [np.nextafter(edges, 0), edges, np.nextafter(edges, np.inf)]
+    ).astype(np.float32)
+
+    results = []
+    for use_numba in (True, False):
+        monkeypatch.setattr(_numba, "HAS_NUMBA", use_numba)
+        results.append(AR_categorization_evolution_scheme(
+            ivt, bin_width=333.3, max_category=20
+        ).final_categories)
+
+    assert np.array_equal(*results)
+
+
+def test_inf_ivt_stays_inf(backend):
+    ivt = np.array([np.inf, 300.0, 300.0, 300.0, 300.0])
+    _, cumulative, _, _ = AR_categorization_scheme(ivt)
+
+    assert np.all(cumulative == np.inf)
+
+
+@pytest.mark.skipif(not _numba.HAS_NUMBA, reason="numba not installed")
+def test_compensated_cumulative_ivt(monkeypatch):
+    monkeypatch.setattr(_numba, "HAS_NUMBA", True)
+
+    # A naive running sum drifts by ~1e-6 over a million steps
+    ivt = np.full(1_000_000, 0.1)
+    _, cumulative, _, _ = AR_categorization_scheme(ivt, bin_width=0.05)
+
+    assert cumulative[-1] == math.fsum(ivt)
+
+
+@pytest.mark.skipif(not _numba.HAS_NUMBA, reason="numba not installed")
+@pytest.mark.parametrize("dtype", [">f8", ">f4", "float16"])
+def test_non_native_dtypes(monkeypatch, dtype):
+    ivt = np.array([800.0] * 12 + [0.0, 300.0, 300.0, 0.0, 500.0]).astype(dtype)
+
+    for func in [AR_categorization_scheme, AR_categorization_evolution_scheme]:
+        monkeypatch.setattr(_numba, "HAS_NUMBA", True)
+        compiled = func(ivt)
+        monkeypatch.setattr(_numba, "HAS_NUMBA", False)
+        vectorized = func(ivt)
+
+        for result, expected in zip(compiled, vectorized):
+            assert np.array_equal(result, expected)